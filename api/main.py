@@ -1,5 +1,12 @@
+import asyncio
+import io
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
@@ -10,16 +17,43 @@ from services.audit_chain_service import AuditChainService
 from services.explanation_service import ExplanationService
 from services.audit_bundle_service import AuditBundleService
 
-# Initialize services
-audit_chain_service = AuditChainService()
+# Initialize services (set AUDIT_CHAIN_LOG to persist the audit chain across restarts)
+audit_chain_service = AuditChainService(log_path=os.getenv("AUDIT_CHAIN_LOG"))
 explanation_service = ExplanationService()
 evidence_service = EvidenceService(audit_chain_service)
 audit_bundle_service = AuditBundleService(audit_chain_service, explanation_service)
 
+logger = logging.getLogger(__name__)
+
+# Seconds between retention prunes of the evidence store
+PRUNE_INTERVAL_SECONDS = int(os.getenv("EVIDENCE_PRUNE_INTERVAL", "3600"))
+
+
+async def prune_periodically():
+    """Drop evidence past its retention floor every PRUNE_INTERVAL_SECONDS"""
+    while True:
+        await asyncio.sleep(PRUNE_INTERVAL_SECONDS)
+        try:
+            summary = await run_in_threadpool(evidence_service.prune_expired_evidence)
+            logger.info("Pruned %d expired evidence records", summary["pruned"])
+        except Exception:
+            # Keep the schedule running; the next pass retries
+            logger.exception("Evidence retention prune failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prune_task = asyncio.create_task(prune_periodically())
+    yield
+    prune_task.cancel()
+    audit_chain_service.close()
+
+
 app = FastAPI(
     title="Evidence & Audit Trust Layer API",
     description="Evidence, Auditability & Trust Layer for PCI/PII Compliance System",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -51,7 +85,7 @@ async def root():
 
 
 @app.post("/evidence/capture", response_model=CaptureEvidenceResponse)
-async def capture_evidence(request: CaptureEvidenceRequest):
+def capture_evidence(request: CaptureEvidenceRequest):
     """Capture a new evidence record"""
     try:
         evidence = evidence_service.capture_evidence(
@@ -74,7 +108,7 @@ async def capture_evidence(request: CaptureEvidenceRequest):
 
 
 @app.get("/evidence/{evidence_id}")
-async def get_evidence(evidence_id: str):
+def get_evidence(evidence_id: str):
     """Get evidence by ID"""
     evidence = evidence_service.get_evidence(evidence_id)
     if not evidence:
@@ -84,16 +118,19 @@ async def get_evidence(evidence_id: str):
 
 
 @app.get("/evidence")
-async def list_evidence(
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None),
-    tenant_id: Optional[str] = Query(None)
+def list_evidence(
+    start_date: Optional[datetime] = Query(None, description="Start date (inclusive)"),
+    end_date: Optional[datetime] = Query(None, description="End date (exclusive)"),
+    tenant_id: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0, description="Records to skip"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum records to return (default: all)")
 ):
-    """List evidence records, optionally filtered by date range"""
+    """List evidence records in time order, optionally filtered by date range and tenant"""
     if start_date and end_date:
         evidence_records = evidence_service.get_evidence_in_range(start_date, end_date, tenant_id)
+        evidence_records = evidence_records[offset:None if limit is None else offset + limit]
     else:
-        evidence_records = evidence_service.list_all_evidence()
+        evidence_records = evidence_service.list_page(offset, limit, tenant_id)
     
     return {
         "count": len(evidence_records),
@@ -102,9 +139,9 @@ async def list_evidence(
 
 
 @app.get("/audit/trail")
-async def get_audit_trail(
-    start_date: Optional[datetime] = Query(None),
-    end_date: Optional[datetime] = Query(None)
+def get_audit_trail(
+    start_date: Optional[datetime] = Query(None, description="Start date (inclusive)"),
+    end_date: Optional[datetime] = Query(None, description="End date (exclusive)")
 ):
     """Get audit trail (hash chain)"""
     if start_date and end_date:
@@ -119,14 +156,16 @@ async def get_audit_trail(
 
 
 @app.get("/audit/verify")
-async def verify_audit_trail():
+def verify_audit_trail(
+    full: bool = Query(False, description="Re-check the whole chain instead of only new nodes")
+):
     """Verify audit trail integrity"""
-    verification = audit_chain_service.verify_chain()
+    verification = audit_chain_service.verify_chain(full=full)
     return verification
 
 
 @app.get("/explanation/{evidence_id}")
-async def get_explanation(evidence_id: str):
+def get_explanation(evidence_id: str):
     """Get explanation for evidence record"""
     evidence = evidence_service.get_evidence(evidence_id)
     if not evidence:
@@ -137,10 +176,11 @@ async def get_explanation(evidence_id: str):
 
 
 @app.post("/audit/generate-bundle")
-async def generate_audit_bundle(
+def generate_audit_bundle(
     tenant_id: str = Query(..., description="Tenant identifier"),
-    start_date: datetime = Query(..., description="Start date"),
-    end_date: datetime = Query(..., description="End date")
+    start_date: datetime = Query(..., description="Start date (inclusive)"),
+    end_date: datetime = Query(..., description="End date (exclusive)"),
+    include_full_chain: bool = Query(False, description="Also export the full hash chain for the range (other tenants' nodes without evidence_data)")
 ):
     """Generate audit bundle ZIP file"""
     # Get evidence in range
@@ -149,20 +189,28 @@ async def generate_audit_bundle(
     if not evidence_records:
         raise HTTPException(status_code=404, detail="No evidence found in date range")
     
-    # Generate bundle
-    bundle_bytes = audit_bundle_service.generate_bundle(
+    # Generate bundle into a spooled temp file (in memory when small, on disk
+    # when large) so failures surface as errors before any bytes are sent
+    bundle_file = audit_bundle_service.generate_bundle_file(
         tenant_id=tenant_id,
         start_date=start_date,
         end_date=end_date,
-        evidence_records=evidence_records
+        evidence_records=evidence_records,
+        include_full_chain=include_full_chain
     )
+    bundle_size = bundle_file.seek(0, io.SEEK_END)
+    bundle_file.seek(0)
     
     filename = f"audit_bundle_{tenant_id}_{start_date.date()}_{end_date.date()}.zip"
     
-    return Response(
-        content=bundle_bytes,
+    return StreamingResponse(
+        iter(lambda: bundle_file.read(65536), b""),
         media_type="application/zip",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(bundle_size)
+        },
+        background=BackgroundTask(bundle_file.close)
     )
 
 
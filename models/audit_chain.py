@@ -12,4 +12,5 @@ class AuditChainNode(BaseModel):
     data_hash: str = Field(..., description="Hash of evidence data")
     record_hash: str = Field(..., description="Hash of this record (includes previous_hash)")
     sequence_number: int = Field(..., description="Sequence number in chain")
+    algorithm: str = Field("sha256", description="Hash algorithm used for data_hash and record_hash")
 
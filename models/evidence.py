@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from enum import Enum
@@ -19,6 +19,9 @@ class EventType(str, Enum):
 
 class EvidenceRecord(BaseModel):
     """Core evidence model for compliance events"""
+    # Records are hashed into the audit chain, so they are immutable once built
+    model_config = ConfigDict(frozen=True, extra="forbid")
+    
     evidence_id: str = Field(..., description="Unique evidence identifier")
     event_type: EventType = Field(..., description="Type of event")
     regulation: Dict[str, Any] = Field(..., description="Regulation framework and clause details")
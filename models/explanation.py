@@ -1,11 +1,26 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Dict, Any, Optional
 
 
+@dataclass(slots=True, frozen=True)
+class Narrative:
+    """Detailed narrative of an explanation (serialized as a plain object)"""
+    what: str
+    why_flagged: str
+    regulation_context: Dict[str, Any]
+    detection_details: Dict[str, Any]
+    remediation_choice: Dict[str, Any]
+    agent_reasoning: Dict[str, Any]
+
+
 class Explanation(BaseModel):
     """Human-readable explanation of agent decisions"""
+    # Explanations are cached and shared between callers, so they are immutable
+    model_config = ConfigDict(frozen=True)
+    
     explanation_id: str = Field(..., description="Unique explanation identifier")
     decision_summary: str = Field(..., description="Brief summary of decision")
-    narrative: Dict[str, Any] = Field(..., description="Detailed narrative explanation")
+    narrative: Narrative = Field(..., description="Detailed narrative explanation")
     visualization: Optional[Dict[str, Any]] = Field(None, description="Visualization data (graph, etc.)")
 
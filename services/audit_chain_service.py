@@ -1,60 +1,306 @@
+import bisect
 import hashlib
-import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from collections.abc import Sequence
+from typing import Optional, List, Dict, Any, Tuple
+import blake3
+import orjson
 from models.evidence import EvidenceRecord
 from models.audit_chain import AuditChainNode
+from services.chain_log import ChainLog
+from services.timestamps import timestamp_bytes, timestamp_us
+
+
+# Hash algorithm for new chain nodes. Each node records the algorithm it was
+# hashed with, so existing nodes keep verifying if this is changed.
+HASH_ALGORITHM = os.getenv("AUDIT_HASH_ALGORITHM", "blake3")
+
+
+def _hasher(algorithm: str = HASH_ALGORITHM, data: bytes = b""):
+    """Create a hash object for the given algorithm, optionally fed with data"""
+    if algorithm == "blake3":
+        return blake3.blake3(data)
+    if algorithm == "sha256":
+        return hashlib.sha256(data)
+    raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+
+
+_CANONICAL_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NAIVE_UTC
+
+
+def _canonical_default(value: Any) -> Dict[str, str]:
+    """Type-tag non-JSON values so e.g. Decimal("1") and "1" hash differently"""
+    return {"$type": type(value).__name__, "$value": str(value)}
+
+# EvidenceRecord's schema is fixed, so its top-level keys are emitted in
+# declared order with pre-encoded key prefixes instead of being sorted per call
+_FIELD_ORDER = tuple(EvidenceRecord.model_fields)
+_FIELD_PREFIXES = tuple(orjson.dumps(name) + b":" for name in _FIELD_ORDER)
+
+
+def canonical_bytes(evidence: EvidenceRecord) -> bytes:
+    """Serialize evidence to canonical JSON bytes
+    
+    Top-level fields follow the model's declared order; the free-form nested
+    dicts are serialized with sorted keys.
+    """
+    dumps, values = orjson.dumps, evidence.__dict__
+    return b"{" + b",".join([
+        prefix + dumps(values[name], option=_CANONICAL_OPTIONS, default=_canonical_default)
+        for prefix, name in zip(_FIELD_PREFIXES, _FIELD_ORDER)
+    ]) + b"}"
+
+
+def canonical_bytes_from_data(evidence_data: Dict[str, Any]) -> bytes:
+    """Re-derive canonical bytes from a node's evidence_data
+    
+    evidence_data is the parsed canonical JSON, so for untampered data this
+    reproduces the bytes that were hashed.
+    """
+    if evidence_data.keys() != set(_FIELD_ORDER):
+        raise ValueError("Evidence data fields do not match the evidence schema")
+    dumps = orjson.dumps
+    return b"{" + b",".join(
+        prefix + dumps(evidence_data[name], option=_CANONICAL_OPTIONS)
+        for prefix, name in zip(_FIELD_PREFIXES, _FIELD_ORDER)
+    ) + b"}"
+
+
+def _merkle_parent(left: bytes, right: bytes) -> bytes:
+    """Hash two Merkle tree children into their parent"""
+    return hashlib.sha256(left + right).digest()
+
+
+def verify_merkle_proof(leaf: bytes, index: int, path: List[bytes], root: bytes) -> bool:
+    """Check a Merkle inclusion proof produced by merkle_root_for_range"""
+    current = leaf
+    for sibling in path:
+        if index % 2 == 0:
+            current = _merkle_parent(current, sibling)
+        else:
+            current = _merkle_parent(sibling, current)
+        index //= 2
+    return current == root
+
+
+class _ReadOnlyList(Sequence):
+    """Read-only view over a list, so callers cannot mutate the chain"""
+    
+    __slots__ = ("_items",)
+    
+    def __init__(self, items: list):
+        self._items = items
+    
+    def __getitem__(self, index):
+        return self._items[index]
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __iter__(self):
+        return iter(self._items)
 
 
 class AuditChainService:
     """Service for managing immutable audit chain"""
     
-    def __init__(self):
+    # Batches smaller than this are hashed inline; a thread pool is not worth it
+    PARALLEL_HASH_THRESHOLD = 64
+    
+    def __init__(self, hash_algorithm: str = HASH_ALGORITHM, log_path: Optional[str] = None):
+        _hasher(hash_algorithm)  # Fail fast on unsupported algorithms
+        self.hash_algorithm = hash_algorithm
         self.chain_store: List[AuditChainNode] = []  # In-memory store (replace with DB)
+        self._by_evidence_id: Dict[str, AuditChainNode] = {}
+        # Canonical bytes per chain position, kept for fast verification and
+        # the log (outside the nodes, so building a node stays cheap)
+        self._canonical: List[bytes] = []
+        # Time index: node timestamps (µs since epoch) kept sorted, with the
+        # parallel chain positions. Usually appends, since nodes arrive in time
+        # order, but a wall clock stepping back gives an out-of-order insert.
+        self._timestamps: List[int] = []
+        self._positions: List[int] = []
+        # Incremental verification state: nodes up to this index have been checked
+        self._verified_through = -1
+        self._cached_errors: List[Dict[str, Any]] = []
+        # Guards the chain, its indexes and the log
+        self._lock = threading.RLock()
+        
+        # Optional append-only log; existing nodes are reloaded on startup
+        self._log: Optional[ChainLog] = None
+        if log_path:
+            self._log = ChainLog(log_path)
+            for row, evidence_bytes in self._log.read_rows():
+                # Evidence is always taken from the hashed bytes, never from
+                # separately stored JSON, so edits to the log fail verification
+                try:
+                    row["evidence_data"] = orjson.loads(evidence_bytes)
+                except orjson.JSONDecodeError:
+                    row["evidence_data"] = {}
+                self._store(self._from_row(row), evidence_bytes, persist=False)
     
-    def compute_hash(self, data: str) -> str:
-        """Compute SHA256 hash"""
-        return hashlib.sha256(data.encode()).hexdigest()
+    def compute_hash(self, data: bytes, algorithm: Optional[str] = None) -> str:
+        """Compute hash of pre-serialized bytes in a single call"""
+        return _hasher(algorithm or self.hash_algorithm, data).hexdigest()
+    
+    def compute_record_hash(
+        self,
+        previous_hash: Optional[str],
+        data_hash: str,
+        ts_bytes: bytes,
+        algorithm: Optional[str] = None
+    ) -> str:
+        """Hash previous/data digests and the timestamp bytes into a record hash"""
+        h = _hasher(algorithm or self.hash_algorithm)
+        if previous_hash:
+            h.update(bytes.fromhex(previous_hash))
+        h.update(bytes.fromhex(data_hash))
+        h.update(ts_bytes)
+        return h.hexdigest()
     
     def create_node(
         self,
         evidence: EvidenceRecord,
         previous_hash: Optional[str],
-        sequence_number: int
+        sequence_number: int,
+        evidence_data: Optional[Dict[str, Any]] = None,
+        evidence_bytes: Optional[bytes] = None,
+        data_hash: Optional[str] = None,
+        ts_bytes: Optional[bytes] = None
     ) -> AuditChainNode:
-        """Create a new audit chain node"""
-        # Serialize evidence
-        evidence_json = json.dumps(evidence.model_dump(), sort_keys=True, default=str)
-        data_hash = self.compute_hash(evidence_json)
+        """Create a new audit chain node
+        
+        evidence_data/evidence_bytes/data_hash/ts_bytes may be passed in when
+        the caller has already serialized or hashed the evidence; otherwise
+        they are computed here.
+        """
+        # Serialize evidence once; evidence_data is the parsed form of the
+        # canonical bytes, so a full verify can re-derive them
+        if evidence_bytes is None:
+            evidence_bytes = canonical_bytes(evidence)
+        if evidence_data is None:
+            evidence_data = orjson.loads(evidence_bytes)
+        if data_hash is None:
+            data_hash = self.compute_hash(evidence_bytes)
         
         # Compute record hash (includes previous hash for chaining)
-        hash_input = f"{previous_hash or ''}{data_hash}{evidence.timestamp.isoformat()}"
-        record_hash = self.compute_hash(hash_input)
-        
-        return AuditChainNode(
-            evidence_id=evidence.evidence_id,
-            previous_hash=previous_hash,
-            timestamp=evidence.timestamp,
-            evidence_data=evidence.model_dump(),
-            data_hash=data_hash,
-            record_hash=record_hash,
-            sequence_number=sequence_number
-        )
-    
-    def append(self, evidence: EvidenceRecord) -> AuditChainNode:
-        """Append evidence to audit chain"""
-        # Get last node's hash
-        last_node = self.get_latest_node()
+        if ts_bytes is None:
+            ts_bytes = timestamp_bytes(evidence.timestamp)
+        record_hash = self.compute_record_hash(previous_hash, data_hash, ts_bytes)
+        
+        return self._from_row({
+            "evidence_id": evidence.evidence_id,
+            "previous_hash": previous_hash,
+            "timestamp": evidence.timestamp,
+            "evidence_data": evidence_data,
+            "data_hash": data_hash,
+            "record_hash": record_hash,
+            "sequence_number": sequence_number,
+            "algorithm": self.hash_algorithm
+        })
+    
+    @staticmethod
+    def _from_row(row: Dict[str, Any]) -> AuditChainNode:
+        """Build a node from its fields
+        
+        This uses the validating constructor: for these flat rows it measures
+        faster than model_construct, which falls back to Python-level
+        field handling.
+        """
+        return AuditChainNode(**row)
+    
+    def append(
+        self,
+        evidence: EvidenceRecord,
+        evidence_data: Optional[Dict[str, Any]] = None,
+        evidence_bytes: Optional[bytes] = None,
+        ts_bytes: Optional[bytes] = None,
+        data_hash: Optional[str] = None
+    ) -> AuditChainNode:
+        """Append evidence to audit chain
+        
+        evidence_data/evidence_bytes/ts_bytes/data_hash may be passed in when
+        the caller has already serialized and hashed the record. If the log
+        write fails the error is raised and nothing is added to the chain.
+        """
+        with self._lock:
+            return self._link([(evidence, evidence_data, evidence_bytes, data_hash, ts_bytes)])[0]
+    
+    def append_batch(self, records: List[EvidenceRecord]) -> List[AuditChainNode]:
+        """Append a batch of evidence records to the audit chain
+        
+        Data hashes are independent, so they are computed on a thread pool
+        (hashlib and blake3 release the GIL while hashing); the record hashes
+        are then linked serially in batch order.
+        """
+        evidence_bytes = [canonical_bytes(evidence) for evidence in records]
+        evidence_data = [orjson.loads(data) for data in evidence_bytes]
+        
+        if len(records) < self.PARALLEL_HASH_THRESHOLD:
+            data_hashes = [self.compute_hash(data) for data in evidence_bytes]
+        else:
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                data_hashes = list(executor.map(self.compute_hash, evidence_bytes))
+        
+        with self._lock:
+            return self._link([
+                (evidence, evidence_data[i], evidence_bytes[i], data_hashes[i], timestamp_bytes(evidence.timestamp))
+                for i, evidence in enumerate(records)
+            ])
+    
+    def close(self) -> None:
+        """Close the chain log; call once no more records will be appended"""
+        with self._lock:
+            if self._log:
+                self._log.close()
+    
+    def _link(self, entries: List[Tuple[EvidenceRecord, Dict[str, Any], bytes, str, bytes]]) -> List[AuditChainNode]:
+        """Chain (evidence, data, bytes, data hash, ts bytes) entries in order
+        
+        Missing forms are computed by create_node. Callers hold self._lock.
+        """
+        last_node = self.chain_store[-1] if self.chain_store else None
         previous_hash = last_node.record_hash if last_node else None
-        sequence_number = len(self.chain_store)
         
-        # Create new node
-        node = self.create_node(evidence, previous_hash, sequence_number)
+        nodes = []
+        for evidence, evidence_data, evidence_bytes, data_hash, ts_bytes in entries:
+            if evidence_bytes is None:
+                evidence_bytes = canonical_bytes(evidence)
+            node = self.create_node(
+                evidence,
+                previous_hash,
+                len(self.chain_store),
+                evidence_data,
+                evidence_bytes,
+                data_hash,
+                ts_bytes
+            )
+            self._store(node, evidence_bytes)
+            nodes.append(node)
+            previous_hash = node.record_hash
         
-        # Add to chain
+        return nodes
+    
+    def _store(self, node: AuditChainNode, evidence_bytes: bytes, persist: bool = True) -> None:
+        """Add a linked node and its canonical bytes to the chain and its indexes"""
+        if persist and self._log:
+            self._log.append(node, evidence_bytes)
+        position = len(self.chain_store)
         self.chain_store.append(node)
+        self._canonical.append(evidence_bytes)
+        self._by_evidence_id[node.evidence_id] = node
         
-        return node
+        key = timestamp_us(node.timestamp)
+        if self._timestamps and key < self._timestamps[-1]:
+            index = bisect.bisect_right(self._timestamps, key)
+            self._timestamps.insert(index, key)
+            self._positions.insert(index, position)
+        else:
+            self._timestamps.append(key)
+            self._positions.append(position)
     
     def get_latest_node(self) -> Optional[AuditChainNode]:
         """Get the most recent node in chain"""
@@ -65,18 +311,66 @@ class AuditChainService:
         start_date: datetime,
         end_date: datetime
     ) -> List[AuditChainNode]:
-        """Get chain nodes in date range"""
-        return [
-            node for node in self.chain_store
-            if start_date <= node.timestamp <= end_date
-        ]
-    
-    def get_all_nodes(self) -> List[AuditChainNode]:
-        """Get all nodes in chain"""
-        return self.chain_store.copy()
-    
-    def verify_chain(self) -> Dict[str, Any]:
-        """Verify hash chain integrity"""
+        """Get chain nodes in date range (start inclusive, end exclusive), in chain order"""
+        with self._lock:
+            lo = bisect.bisect_left(self._timestamps, timestamp_us(start_date))
+            hi = bisect.bisect_left(self._timestamps, timestamp_us(end_date), lo)
+            positions = sorted(self._positions[lo:hi])
+            if not positions:
+                return []
+            if positions[-1] - positions[0] == len(positions) - 1:
+                # Contiguous run of the chain (the usual case)
+                return self.chain_store[positions[0]:positions[-1] + 1]
+            return [self.chain_store[position] for position in positions]
+    
+    def merkle_root_for_range(
+        self,
+        start_date: datetime,
+        end_date: datetime
+    ) -> Tuple[bytes, Dict[str, Tuple[int, List[bytes]]]]:
+        """Build a SHA-256 Merkle tree over the record hashes in a date range
+        
+        Returns the root and, per evidence ID, the leaf index and the sibling
+        path from leaf to root. An odd node at any level is paired with itself.
+        """
+        nodes = self.get_chain_in_range(start_date, end_date)
+        if not nodes:
+            return b"", {}
+        
+        level = [bytes.fromhex(node.record_hash) for node in nodes]
+        paths: List[List[bytes]] = [[] for _ in nodes]
+        positions = list(range(len(nodes)))
+        
+        while len(level) > 1:
+            if len(level) % 2:
+                level.append(level[-1])
+            for leaf, position in enumerate(positions):
+                paths[leaf].append(level[position ^ 1])
+                positions[leaf] = position // 2
+            level = [_merkle_parent(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+        
+        proofs = {
+            node.evidence_id: (index, paths[index])
+            for index, node in enumerate(nodes)
+        }
+        return level[0], proofs
+    
+    def get_all_nodes(self) -> Sequence[AuditChainNode]:
+        """Get all nodes in chain (read-only view, not a copy)"""
+        return _ReadOnlyList(self.chain_store)
+    
+    def verify_chain(self, full: bool = False) -> Dict[str, Any]:
+        """Verify hash chain integrity
+        
+        Only nodes appended since the last call are checked, against the
+        bytes cached at append time; errors found earlier are carried over.
+        Pass full=True to re-check the whole chain, re-deriving each node's
+        bytes from the evidence_data it serves.
+        """
+        with self._lock:
+            return self._verify(full)
+    
+    def _verify(self, full: bool) -> Dict[str, Any]:
         if len(self.chain_store) == 0:
             return {"valid": True, "message": "Empty chain", "errors": []}
         
@@ -84,11 +378,16 @@ class AuditChainService:
             # Single node (genesis)
             return {"valid": True, "message": "Single node (genesis)", "errors": []}
         
-        errors = []
+        if full:
+            self._verified_through = -1
+            self._cached_errors = []
+        
+        start = self._verified_through + 1
+        errors = self._cached_errors
         
         # Check genesis node
         genesis = self.chain_store[0]
-        if genesis.previous_hash is not None:
+        if start == 0 and genesis.previous_hash is not None:
             errors.append({
                 "node": genesis.evidence_id,
                 "issue": "Genesis node should have null previous_hash",
@@ -96,7 +395,7 @@ class AuditChainService:
             })
         
         # Check chain integrity
-        for i in range(1, len(self.chain_store)):
+        for i in range(max(1, start), len(self.chain_store)):
             current_node = self.chain_store[i]
             previous_node = self.chain_store[i-1]
             
@@ -110,9 +409,25 @@ class AuditChainService:
                 })
         
         # Verify each node's hash is correct
-        for node in self.chain_store:
-            evidence_json = json.dumps(node.evidence_data, sort_keys=True, default=str)
-            expected_data_hash = self.compute_hash(evidence_json)
+        for position in range(start, len(self.chain_store)):
+            node = self.chain_store[position]
+            if full:
+                evidence_data = node.evidence_data
+                if evidence_data.get("evidence_id") != node.evidence_id:
+                    errors.append({
+                        "node": node.evidence_id,
+                        "issue": "Evidence ID mismatch",
+                        "expected": node.evidence_id,
+                        "actual": evidence_data.get("evidence_id")
+                    })
+                try:
+                    data = canonical_bytes_from_data(evidence_data)
+                except (ValueError, TypeError) as e:
+                    errors.append({"node": node.evidence_id, "issue": f"Malformed evidence data: {e}"})
+                    continue
+            else:
+                data = self._canonical[position]
+            expected_data_hash = self.compute_hash(data, node.algorithm)
             
             if node.data_hash != expected_data_hash:
                 errors.append({
@@ -123,8 +438,9 @@ class AuditChainService:
                 })
             
             # Verify record hash
-            hash_input = f"{node.previous_hash or ''}{node.data_hash}{node.timestamp.isoformat()}"
-            expected_record_hash = self.compute_hash(hash_input)
+            expected_record_hash = self.compute_record_hash(
+                node.previous_hash, node.data_hash, timestamp_bytes(node.timestamp), node.algorithm
+            )
             
             if node.record_hash != expected_record_hash:
                 errors.append({
@@ -134,16 +450,15 @@ class AuditChainService:
                     "actual": node.record_hash
                 })
         
+        self._verified_through = len(self.chain_store) - 1
+        
         return {
             "valid": len(errors) == 0,
             "total_nodes": len(self.chain_store),
-            "errors": errors
+            "errors": list(errors)
         }
     
     def get_node_by_evidence_id(self, evidence_id: str) -> Optional[AuditChainNode]:
         """Get chain node by evidence ID"""
-        for node in self.chain_store:
-            if node.evidence_id == evidence_id:
-                return node
-        return None
+        return self._by_evidence_id.get(evidence_id)
 
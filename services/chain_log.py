@@ -0,0 +1,78 @@
+import os
+import struct
+from typing import Iterator, Optional, Tuple, Dict, Any
+import orjson
+from models.audit_chain import AuditChainNode
+from services.timestamps import timestamp_us
+
+
+# Fixed-size entry header: sequence number, timestamp (µs since epoch, UTC),
+# previous/record hash digests, then the lengths of the two variable parts
+_HEADER = struct.Struct("<Qq32s32sII")
+
+
+def _digest(hex_hash: Optional[str]) -> bytes:
+    return bytes.fromhex(hex_hash) if hex_hash else bytes(32)
+
+
+class ChainLog:
+    """Append-only on-disk log of audit chain nodes
+
+    Each entry is a fixed header followed by the node's metadata as JSON and
+    the canonical evidence bytes the node was hashed from. The evidence
+    itself is stored only as those bytes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Unbuffered: every entry is written through immediately anyway, and a
+        # failed write must not leave bytes behind in a buffer
+        self._file = open(path, "ab", buffering=0)
+
+    def append(self, node: AuditChainNode, body: bytes) -> None:
+        """Write a node and the canonical bytes it was hashed over to the end of the log"""
+        meta = orjson.dumps(node.model_dump(mode="json", exclude={"evidence_data"}))
+        header = _HEADER.pack(
+            node.sequence_number,
+            timestamp_us(node.timestamp),
+            _digest(node.previous_hash),
+            _digest(node.record_hash),
+            len(meta),
+            len(body)
+        )
+        offset = self._file.seek(0, os.SEEK_END)
+        try:
+            remaining = memoryview(header + meta + body)
+            while remaining:
+                remaining = remaining[self._file.write(remaining):]
+        except OSError:
+            # Drop any partial entry so later appends follow a complete one
+            self._file.truncate(offset)
+            raise
+
+    def read_rows(self) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+        """Read every complete entry as (node fields, canonical bytes)
+        
+        A torn trailing entry (from a crash mid-write) is truncated away.
+        """
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            _, _, _, _, meta_len, body_len = _HEADER.unpack_from(data, offset)
+            end = offset + _HEADER.size + meta_len + body_len
+            if end > len(data):
+                break
+            meta_start = offset + _HEADER.size
+            yield orjson.loads(data[meta_start:meta_start + meta_len]), data[meta_start + meta_len:end]
+            offset = end
+
+        if offset < len(data):
+            self._file.truncate(offset)
+
+    def close(self) -> None:
+        self._file.close()
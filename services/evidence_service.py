@@ -1,25 +1,215 @@
+import bisect
 import hashlib
+import itertools
 import json
+import secrets
+import sys
+import threading
 import time
-import uuid
-from datetime import datetime
-from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Iterator, Set, Tuple
+import orjson
+from pydantic import TypeAdapter
 from models.evidence import EvidenceRecord, EventType
-from services.audit_chain_service import AuditChainService
+from services.audit_chain_service import AuditChainService, canonical_bytes
+from services.timestamps import timestamp_bytes, timestamp_us, utc_from_ns
+
+
+# Low-cardinality string fields repeated across many records; interning
+# them makes every record share one copy of each value
+_INTERNED_FIELDS = {
+    "regulation": ("framework", "clause"),
+    "detection": ("detected_by",),
+    "remediation": ("action_type", "agent_id"),
+    "metadata": ("tenant_id",)
+}
+
+
+def _tenant_of(evidence: EvidenceRecord) -> Optional[str]:
+    return evidence.metadata.get("tenant_id") if evidence.metadata else None
+
+
+def _intern_fields(section: Optional[Dict[str, Any]], keys: tuple) -> Optional[Dict[str, Any]]:
+    """Copy of section with the given string values interned"""
+    if not section:
+        return section
+    interned = dict(section)
+    for key in keys:
+        value = interned.get(key)
+        if type(value) is str:
+            interned[key] = sys.intern(value)
+    return interned
+
+
+# Per-field validators, so an update validates only the fields it changes
+_FIELD_ADAPTERS = {
+    name: TypeAdapter(field.annotation)
+    for name, field in EvidenceRecord.model_fields.items()
+}
+
+
+def _naive_utc(timestamp: datetime) -> datetime:
+    """The store keeps timestamps as naive UTC"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _validate_updates(updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate and coerce the changed fields of an evidence update"""
+    unknown = updates.keys() - _FIELD_ADAPTERS.keys()
+    if unknown:
+        raise ValueError(f"Unknown evidence fields: {', '.join(sorted(unknown))}")
+    if "evidence_id" in updates:
+        # The ID keys the store, the indexes and the audit chain
+        raise ValueError("evidence_id cannot be updated")
+    
+    validated = {name: _FIELD_ADAPTERS[name].validate_python(value) for name, value in updates.items()}
+    if "timestamp" in validated:
+        validated["timestamp"] = _naive_utc(validated["timestamp"])
+    for section, keys in _INTERNED_FIELDS.items():
+        if section in validated:
+            validated[section] = _intern_fields(validated[section], keys)
+    return validated
+
+
+def _evidence_from_data(evidence_data: Dict[str, Any]) -> EvidenceRecord:
+    """Rebuild a stored record from a chain node's evidence_data"""
+    data = dict(evidence_data)
+    for section, keys in _INTERNED_FIELDS.items():
+        data[section] = _intern_fields(data.get(section), keys)
+    # Canonical timestamps carry an explicit UTC offset
+    data["timestamp"] = _naive_utc(datetime.fromisoformat(data["timestamp"]))
+    return EvidenceRecord(**data)
+
+
+class _TimeIndex:
+    """Evidence IDs with a parallel timestamp list, kept in time order
+    
+    Timestamps are stored as integer microseconds since the epoch (UTC), so
+    bisecting compares ints instead of datetimes and naive and aware bounds
+    both work. Range lookups are a bisect plus a slice. Inserts are appends
+    in the common in-order case and a sorted insert otherwise.
+    
+    Writers update the two lists in separate steps, so the index is only
+    read or written under EvidenceService._lock.
+    """
+    
+    def __init__(self):
+        self.timestamps: List[int] = []
+        self.ids: List[str] = []
+    
+    def append(self, key: int, evidence_id: str) -> None:
+        """Add an entry, appending when it is not older than the newest one"""
+        if self.timestamps and key < self.timestamps[-1]:
+            # Out of order (e.g. the wall clock stepped back): keep the invariant
+            self.insert(key, evidence_id)
+            return
+        self.timestamps.append(key)
+        self.ids.append(evidence_id)
+    
+    def insert(self, key: int, evidence_id: str) -> None:
+        """Insert at the sorted position (after equal keys)"""
+        position = bisect.bisect_right(self.timestamps, key)
+        self.timestamps.insert(position, key)
+        self.ids.insert(position, evidence_id)
+    
+    def remove(self, key: int, evidence_id: str) -> None:
+        position = bisect.bisect_left(self.timestamps, key)
+        position = self.ids.index(evidence_id, position)
+        del self.timestamps[position]
+        del self.ids[position]
+    
+    def pop_before(self, before: int) -> Tuple[List[int], List[str]]:
+        """Remove and return the keys and IDs of the entries keyed before `before` (µs)"""
+        hi = bisect.bisect_left(self.timestamps, before)
+        keys, ids = self.timestamps[:hi], self.ids[:hi]
+        del self.timestamps[:hi]
+        del self.ids[:hi]
+        return keys, ids
+    
+    def drop(self, first: int, last: int, evidence_ids: Set[str]) -> None:
+        """Remove the given IDs, whose keys all lie in [first, last] (µs)
+        
+        Only the entries in that key span are scanned.
+        """
+        lo = bisect.bisect_left(self.timestamps, first)
+        hi = bisect.bisect_right(self.timestamps, last, lo)
+        kept = [
+            (key, evidence_id)
+            for key, evidence_id in zip(self.timestamps[lo:hi], self.ids[lo:hi])
+            if evidence_id not in evidence_ids
+        ]
+        self.timestamps[lo:hi] = [key for key, _ in kept]
+        self.ids[lo:hi] = [evidence_id for _, evidence_id in kept]
+    
+    def range(self, start_date: datetime, end_date: datetime) -> List[str]:
+        """IDs with start_date <= timestamp < end_date"""
+        lo = bisect.bisect_left(self.timestamps, timestamp_us(start_date))
+        hi = bisect.bisect_left(self.timestamps, timestamp_us(end_date), lo)
+        return self.ids[lo:hi]
 
 
 class EvidenceService:
     """Service for capturing and managing evidence records"""
     
+    # How long evidence is kept in the store, by regulation framework
+    RETENTION_FLOORS: Dict[str, timedelta] = {
+        "GDPR": timedelta(days=365 * 6),
+        "HIPAA": timedelta(days=365 * 6),
+        "SOX": timedelta(days=365 * 7),
+        "PCI-DSS": timedelta(days=365),
+        "EU_AI_ACT": timedelta(days=365 * 7),
+        "DEFAULT": timedelta(days=90)
+    }
+    
     def __init__(self, audit_chain_service: AuditChainService):
         self.audit_chain_service = audit_chain_service
         self.evidence_store: Dict[str, EvidenceRecord] = {}  # In-memory store (replace with DB)
+        # ID uniqueness: per-process random tag + monotonic counter
+        self._id_node = secrets.token_hex(2).upper()
+        self._id_counter = itertools.count(1)
+        # Range indexes, global and per tenant
+        self._time_index = _TimeIndex()
+        self._by_tenant: Dict[str, _TimeIndex] = {}
+        # One index per retention floor, so the oldest entries of each are
+        # the next to expire and a prune pops them off the front
+        self._by_floor: Dict[str, _TimeIndex] = {name: _TimeIndex() for name in self.RETENTION_FLOORS}
+        # Serializes writes, so records reach the audit chain in timestamp order
+        self._lock = threading.Lock()
+        
+        # Rebuild the store from a persisted audit chain. evidence_data is the
+        # parsed form of the hashed bytes, so the rebuilt record matches them;
+        # nodes that cannot be rebuilt are left for verify_chain to report.
+        # Records already past their retention floor are not restored, so
+        # pruned evidence stays pruned across restarts.
+        now_us = time.time_ns() // 1000
+        floors = self._floors_us()
+        for node in audit_chain_service.get_all_nodes():
+            try:
+                evidence = _evidence_from_data(node.evidence_data)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if now_us - timestamp_us(evidence.timestamp) > floors[self._floor_name(evidence)]:
+                continue
+            self._index(evidence)
+    
+    @classmethod
+    def _floors_us(cls) -> Dict[str, int]:
+        """Retention floors in µs, to compare with index keys"""
+        return {name: floor // timedelta(microseconds=1) for name, floor in cls.RETENTION_FLOORS.items()}
+    
+    @classmethod
+    def _floor_name(cls, evidence: EvidenceRecord) -> str:
+        """The RETENTION_FLOORS entry that applies to a record"""
+        framework = evidence.regulation.get("framework")
+        return framework if framework in cls.RETENTION_FLOORS else "DEFAULT"
     
-    def generate_evidence_id(self) -> str:
+    def generate_evidence_id(self, now_ns: Optional[int] = None) -> str:
         """Generate unique evidence ID"""
-        timestamp = int(time.time())
-        unique_id = uuid.uuid4().hex[:6].upper()
-        return f"EVID-{timestamp}-{unique_id}"
+        if now_ns is None:
+            now_ns = time.time_ns()
+        return f"EVID-{now_ns}-{self._id_node}{next(self._id_counter):06X}"
     
     def capture_evidence(
         self,
@@ -33,47 +223,105 @@ class EvidenceService:
         metadata: Optional[Dict[str, Any]] = None
     ) -> EvidenceRecord:
         """Capture a new evidence record"""
-        evidence_id = self.generate_evidence_id()
-        
-        evidence = EvidenceRecord(
-            evidence_id=evidence_id,
-            event_type=event_type,
-            regulation=regulation,
-            detection=detection,
-            violation_state=violation_state,
-            remediation=remediation,
-            reasoning_chain=reasoning_chain,
-            linkages=linkages,
-            metadata=metadata,
-            timestamp=datetime.utcnow()
-        )
-        
-        # Store evidence
-        self.evidence_store[evidence_id] = evidence
-        
-        # Append to audit chain
-        self.audit_chain_service.append(evidence)
+        with self._lock:
+            # One clock read for both the ID and the timestamp
+            now_ns = time.time_ns()
+            evidence_id = self.generate_evidence_id(now_ns)
+            
+            evidence = EvidenceRecord(
+                evidence_id=evidence_id,
+                event_type=event_type,
+                regulation=_intern_fields(regulation, _INTERNED_FIELDS["regulation"]),
+                detection=_intern_fields(detection, _INTERNED_FIELDS["detection"]),
+                violation_state=violation_state,
+                remediation=_intern_fields(remediation, _INTERNED_FIELDS["remediation"]),
+                reasoning_chain=reasoning_chain,
+                linkages=linkages,
+                metadata=_intern_fields(metadata, _INTERNED_FIELDS["metadata"]),
+                timestamp=utc_from_ns(now_ns)
+            )
+            
+            # Serialize and hash once, and hand every precomputed form to the
+            # audit chain; its node keeps the bytes and hash for verification
+            evidence_bytes = canonical_bytes(evidence)
+            data_hash = self.audit_chain_service.compute_hash(evidence_bytes)
+            
+            # Chained before it is stored, so a failed log write leaves no record
+            self.audit_chain_service.append(
+                evidence,
+                orjson.loads(evidence_bytes),
+                evidence_bytes,
+                timestamp_bytes(evidence.timestamp),
+                data_hash
+            )
+            self._index(evidence)
         
         return evidence
     
+    def _index(self, evidence: EvidenceRecord) -> None:
+        """Add a record to the store and the range indexes"""
+        evidence_id = evidence.evidence_id
+        key = timestamp_us(evidence.timestamp)
+        self.evidence_store[evidence_id] = evidence
+        self._time_index.append(key, evidence_id)
+        self._by_floor[self._floor_name(evidence)].append(key, evidence_id)
+        
+        tenant_id = _tenant_of(evidence)
+        if tenant_id is not None:
+            self._tenant_index(tenant_id).append(key, evidence_id)
+    
+    def _tenant_index(self, tenant_id: str) -> _TimeIndex:
+        index = self._by_tenant.get(tenant_id)
+        if index is None:
+            index = self._by_tenant[tenant_id] = _TimeIndex()
+        return index
+    
+    def _index_for(self, tenant_id: Optional[str]) -> Optional[_TimeIndex]:
+        """The global index, or the tenant's partition (None if it has no records)"""
+        if tenant_id is None:
+            return self._time_index
+        return self._by_tenant.get(tenant_id)
+    
     def get_evidence(self, evidence_id: str) -> Optional[EvidenceRecord]:
         """Retrieve evidence by ID"""
         return self.evidence_store.get(evidence_id)
     
     def update_evidence(self, evidence_id: str, updates: Dict[str, Any]) -> Optional[EvidenceRecord]:
         """Update evidence record (e.g., add after_state after remediation)"""
+        with self._lock:
+            return self._update(evidence_id, updates)
+    
+    def _update(self, evidence_id: str, updates: Dict[str, Any]) -> Optional[EvidenceRecord]:
         evidence = self.evidence_store.get(evidence_id)
         if not evidence:
             return None
         
-        # Update fields
-        evidence_dict = evidence.model_dump()
-        evidence_dict.update(updates)
+        # model_copy does not validate, so validate the changed fields first
+        # (the rest of the record was validated on capture)
+        updated_evidence = evidence.model_copy(update=_validate_updates(updates))
+        
+        # Compute everything that can fail before touching the store or the
+        # indexes, so a failed update leaves the record as it was
+        old_key, new_key = timestamp_us(evidence.timestamp), timestamp_us(updated_evidence.timestamp)
+        old_tenant, new_tenant = _tenant_of(evidence), _tenant_of(updated_evidence)
+        old_floor, new_floor = self._floor_name(evidence), self._floor_name(updated_evidence)
         
-        # Create new record with updates
-        updated_evidence = EvidenceRecord(**evidence_dict)
         self.evidence_store[evidence_id] = updated_evidence
         
+        # Re-position index entries if the timestamp or tenant changed, so the
+        # indexes stay sorted
+        if old_key != new_key:
+            self._time_index.remove(old_key, evidence_id)
+            self._time_index.insert(new_key, evidence_id)
+        if old_key != new_key or old_tenant != new_tenant:
+            if old_tenant is not None:
+                self._by_tenant[old_tenant].remove(old_key, evidence_id)
+            if new_tenant is not None:
+                self._tenant_index(new_tenant).insert(new_key, evidence_id)
+        if old_key != new_key or old_floor != new_floor:
+            self._by_floor[old_floor].remove(old_key, evidence_id)
+            self._by_floor[new_floor].insert(new_key, evidence_id)
+        
         return updated_evidence
     
     def get_evidence_in_range(
@@ -82,16 +330,90 @@ class EvidenceService:
         end_date: datetime,
         tenant_id: Optional[str] = None
     ) -> List[EvidenceRecord]:
-        """Get all evidence records in date range"""
-        results = []
-        for evidence in self.evidence_store.values():
-            if start_date <= evidence.timestamp <= end_date:
-                if tenant_id is None or (evidence.metadata and evidence.metadata.get("tenant_id") == tenant_id):
-                    results.append(evidence)
+        """Get all evidence records in date range (start inclusive, end exclusive)"""
+        with self._lock:
+            index = self._index_for(tenant_id)
+            if index is None:
+                return []
+            evidence_ids = index.range(start_date, end_date)
+        
+        return self._resolve(evidence_ids)
+    
+    def prune_expired_evidence(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Drop evidence records older than their framework's retention floor
+        
+        Only the in-memory store and indexes are pruned; the audit chain is
+        append-only and keeps every node. The returned summary records the
+        chain head at prune time as the clean-cut marker.
+        
+        Expired entries are popped off the front of each floor's index, and
+        the global and tenant indexes are only rewritten over the expired
+        key span, so a pass costs about as much as the records it removes.
+        """
+        if now is None:
+            now = utc_from_ns(time.time_ns())
+        now_us = timestamp_us(now)
+        floors = self._floors_us()
+        
+        with self._lock:
+            expired: Set[str] = set()
+            for name, floor_index in self._by_floor.items():
+                keys, evidence_ids = floor_index.pop_before(now_us - floors[name])
+                if not evidence_ids:
+                    continue
+                
+                dropped = set(evidence_ids)
+                expired |= dropped
+                self._time_index.drop(keys[0], keys[-1], dropped)
+                tenants = {_tenant_of(self.evidence_store[evidence_id]) for evidence_id in evidence_ids}
+                tenants.discard(None)
+                for tenant_id in tenants:
+                    self._by_tenant[tenant_id].drop(keys[0], keys[-1], dropped)
+            
+            for evidence_id in expired:
+                del self.evidence_store[evidence_id]
+        
+        head = self.audit_chain_service.get_latest_node()
+        return {
+            "pruned": len(expired),
+            "remaining": len(self.evidence_store),
+            "pruned_at": now.isoformat(),
+            "chain_head": {
+                "sequence_number": head.sequence_number,
+                "record_hash": head.record_hash
+            } if head else None
+        }
+    
+    def _resolve(self, evidence_ids: List[str]) -> List[EvidenceRecord]:
+        """Look up records for IDs read from an index, after releasing the lock
+        
+        A concurrent prune may delete a record between the index read and the
+        lookup; such records are skipped.
+        """
+        get = self.evidence_store.get
+        return [evidence for evidence in map(get, evidence_ids) if evidence is not None]
+    
+    def iter_all_evidence(self) -> Iterator[EvidenceRecord]:
+        """Iterate over all evidence records without copying the store"""
+        return iter(self.evidence_store.values())
+    
+    def list_page(
+        self,
+        offset: int,
+        limit: Optional[int] = None,
+        tenant_id: Optional[str] = None
+    ) -> List[EvidenceRecord]:
+        """List up to `limit` evidence records (all if None) in time order, skipping `offset`"""
+        end = None if limit is None else offset + limit
+        with self._lock:
+            index = self._index_for(tenant_id)
+            if index is None:
+                return []
+            evidence_ids = index.ids[offset:end]
         
-        return sorted(results, key=lambda e: e.timestamp)
+        return self._resolve(evidence_ids)
     
     def list_all_evidence(self) -> List[EvidenceRecord]:
-        """List all evidence records"""
-        return list(self.evidence_store.values())
+        """List all evidence records (prefer iter_all_evidence or list_page)"""
+        return list(self.iter_all_evidence())
 
@@ -1,27 +1,76 @@
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from models.evidence import EvidenceRecord
-from models.explanation import Explanation
+from models.explanation import Explanation, Narrative
 
 
 class ExplanationService:
     """Service for generating human-readable explanations"""
     
+    CACHE_SIZE = 4096
+    
+    # 'Why flagged' templates, filled with str.format_map; indexed by whether
+    # the detection carries a context
+    _WHY_FLAGGED_TEMPLATES = (
+        "{framework} {clause} requires that {requirement}.",
+        "{framework} {clause} requires that {requirement}. This violation occurred because {context}."
+    )
+    
+    def __init__(self):
+        # LRU cache keyed by evidence_id, holding the record each explanation
+        # was built from. Records are immutable and an update stores a new
+        # one, so an entry is only a hit for that exact record object.
+        self._cache: "OrderedDict[str, Tuple[EvidenceRecord, Explanation]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
     def generate_explanation(self, evidence: EvidenceRecord) -> Explanation:
         """Generate explanation for evidence record"""
+        cached = self._cache_get(evidence)
+        if cached is not None:
+            return cached
+        
+        explanation = self._build_explanation(evidence)
+        self._cache_put(evidence, explanation)
+        return explanation
+    
+    def _cache_get(self, evidence: EvidenceRecord) -> Optional[Explanation]:
+        with self._cache_lock:
+            entry = self._cache.get(evidence.evidence_id)
+            if entry is None or entry[0] is not evidence:
+                return None
+            self._cache.move_to_end(evidence.evidence_id)
+            return entry[1]
+    
+    def _cache_put(self, evidence: EvidenceRecord, explanation: Explanation) -> None:
+        with self._cache_lock:
+            self._cache[evidence.evidence_id] = (evidence, explanation)
+            self._cache.move_to_end(evidence.evidence_id)
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    def _build_explanation(self, evidence: EvidenceRecord) -> Explanation:
+        """Build explanation for evidence record"""
         explanation_id = f"EXP-{evidence.evidence_id}"
         
+        # Read each section once and hand it to the helpers
+        detection = evidence.detection
+        regulation = evidence.regulation
+        remediation = evidence.remediation or {}
+        violation_state = evidence.violation_state
+        
         # Build narrative
-        narrative = {
-            "what": self._build_what(evidence),
-            "why_flagged": self._build_why_flagged(evidence),
-            "regulation_context": evidence.regulation,
-            "detection_details": evidence.detection,
-            "remediation_choice": evidence.remediation or {},
-            "agent_reasoning": evidence.reasoning_chain or {}
-        }
+        narrative = Narrative(
+            self._build_what(detection, violation_state),
+            self._build_why_flagged(detection, regulation),
+            regulation,
+            detection,
+            remediation,
+            evidence.reasoning_chain or {}
+        )
         
         # Build decision summary
-        decision_summary = self._build_decision_summary(evidence)
+        decision_summary = self._build_decision_summary(detection, regulation, remediation)
         
         return Explanation(
             explanation_id=explanation_id,
@@ -29,35 +78,68 @@ class ExplanationService:
             narrative=narrative
         )
     
-    def _build_what(self, evidence: EvidenceRecord) -> str:
+    def generate_explanations(self, evidence_records: List[EvidenceRecord]) -> List[Explanation]:
+        """Generate explanations for a batch of evidence records, in order
+        
+        The cache is consulted and filled under one lock acquisition each,
+        rather than twice per record.
+        """
+        cache = self._cache
+        explanations: List[Optional[Explanation]] = [None] * len(evidence_records)
+        misses = []
+        with self._cache_lock:
+            get, move_to_end = cache.get, cache.move_to_end
+            for i, evidence in enumerate(evidence_records):
+                entry = get(evidence.evidence_id)
+                if entry is None or entry[0] is not evidence:
+                    misses.append(i)
+                else:
+                    move_to_end(evidence.evidence_id)
+                    explanations[i] = entry[1]
+        
+        build = self._build_explanation
+        for i in misses:
+            explanations[i] = build(evidence_records[i])
+        
+        with self._cache_lock:
+            for i in misses:
+                evidence = evidence_records[i]
+                cache[evidence.evidence_id] = (evidence, explanations[i])
+                move_to_end(evidence.evidence_id)
+            while len(cache) > self.CACHE_SIZE:
+                cache.popitem(last=False)
+        
+        return explanations
+    
+    def _build_what(self, detection: Dict[str, Any], violation_state: Optional[Dict[str, Any]]) -> str:
         """Build 'what happened' description"""
-        detected_by = evidence.detection.get("detected_by", "System")
-        violation_type = evidence.violation_state.get("violation_type") if evidence.violation_state else "compliance issue"
+        detected_by = detection.get("detected_by", "System")
+        violation_type = violation_state.get("violation_type") if violation_state else "compliance issue"
         
         return f"{detected_by} detected {violation_type}"
     
-    def _build_why_flagged(self, evidence: EvidenceRecord) -> str:
+    def _build_why_flagged(self, detection: Dict[str, Any], regulation: Dict[str, Any]) -> str:
         """Build 'why was this flagged' explanation"""
-        regulation = evidence.regulation
-        framework = regulation.get("framework", "")
-        clause = regulation.get("clause", "")
-        requirement = regulation.get("requirement", "")
-        
-        context = evidence.detection.get("context", "")
-        
-        explanation = f"{framework} {clause} requires that {requirement}."
-        if context:
-            explanation += f" This violation occurred because {context}."
-        
-        return explanation
+        fields = {
+            "framework": regulation.get("framework", ""),
+            "clause": regulation.get("clause", ""),
+            "requirement": regulation.get("requirement", ""),
+            "context": detection.get("context", "")
+        }
+        return self._WHY_FLAGGED_TEMPLATES[bool(fields["context"])].format_map(fields)
     
-    def _build_decision_summary(self, evidence: EvidenceRecord) -> str:
+    def _build_decision_summary(
+        self,
+        detection: Dict[str, Any],
+        regulation: Dict[str, Any],
+        remediation: Dict[str, Any]
+    ) -> str:
         """Build brief decision summary"""
-        if evidence.remediation:
-            action = evidence.remediation.get("action_type", "remediation")
-            agent = evidence.remediation.get("agent_id", "agent")
+        if remediation:
+            action = remediation.get("action_type", "remediation")
+            agent = remediation.get("agent_id", "agent")
             return f"{agent} executed {action} to resolve violation"
         
-        detected_by = evidence.detection.get("detected_by", "System")
-        return f"{detected_by} flagged violation for {evidence.regulation.get('clause', 'regulation')}"
+        detected_by = detection.get("detected_by", "System")
+        return f"{detected_by} flagged violation for {regulation.get('clause', 'regulation')}"
 
@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def timestamp_us(timestamp: datetime) -> int:
+    """Microseconds since epoch; naive timestamps are treated as UTC"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = timestamp - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def utc_from_ns(ns: int) -> datetime:
+    """Naive UTC datetime for a time.time_ns() reading (truncated to µs)"""
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def timestamp_bytes(timestamp: datetime) -> bytes:
+    """ASCII decimal microseconds since epoch, as hashed into chain records"""
+    return str(timestamp_us(timestamp)).encode("ascii")